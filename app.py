@@ -1,136 +1,173 @@
 import streamlit as st
-from openai import OpenAI
+from openai import AsyncOpenAI
+import asyncio
+import hmac
+import logging
 import os
+import queue
 import random
+import threading
 import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
+# Show this module's INFO logs (e.g. prompt cache hits) in the server console
+# without raising other libraries' log levels. Streamlit re-executes this file
+# on every rerun, so only attach the handler once.
+if not logger.handlers:
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler())
+    logger.propagate = False
 
-# Note: utils/redshift_connection.py was not found in the workspace, 
-# so the Redshift integration has been omitted. 
-# To add it, create the file and import it here.
+_STREAM_END = object()  # queued after the last token of a stream
 
-def get_poem(day_description):
-    # Try to get key from environment variable (e.g. .env file)
-    api_key = os.getenv("OPENAI_API_KEY")
-    
-    # If not found in env, try Streamlit secrets safely
-    if not api_key:
-        try:
-            if "OPENAI_API_KEY" in st.secrets:
-                api_key = st.secrets["OPENAI_API_KEY"]
-        except FileNotFoundError:
-            pass
-        except Exception:
-            pass
-            
-    if not api_key:
-        st.error("OpenAI API Key not found. Please set it in a .env file or Streamlit secrets.")
-        return None, None
-    
-    client = OpenAI(api_key=api_key)
-    
-    poets = [
-        "Emily Dickinson",
-        "T.S. Eliot",
-        "Langston Hughes",
-        "Sylvia Plath",
-        "Seamus Heaney",
-        "Shel Silverstein",
-        "Lewis Carroll",
-        "Robert Frost",
-        "Ogden Nash",
-        "Pablo Neruda",
-        "Dr. Seuss"
-    ]
-    selected_poet = random.choice(poets) if poets else "Unknown Poet"
-    
-    try:
-        # Get system prompt template from env or secrets
-        system_prompt_template = os.getenv("POEM_SYSTEM_PROMPT")
-        if not system_prompt_template:
-            try:
-                if "POEM_SYSTEM_PROMPT" in st.secrets:
-                    system_prompt_template = st.secrets["POEM_SYSTEM_PROMPT"]
-            except:
-                pass
-        
-        # Fallback if secret is missing
-        if not system_prompt_template:
-            system_prompt_template = "You are {poet}. Write a short poem based on the user's description of their day."
-
-        # Using gpt-5.1 as requested
-        response = client.chat.completions.create(
-            model="gpt-5.1",  ## please use gpt-5.1 for the best results. it is a real model available now.
-            messages=[
-                {"role": "system", "content": system_prompt_template.format(poet=selected_poet)},
-                {"role": "user", "content": day_description}
-            ]
-        )
-        return response.choices[0].message.content, selected_poet
-    except Exception as e:
-        st.error(f"Error generating poem: {e}")
-        return None, None
+POEM_CACHE_TTL = 3600  # seconds a finished poem is reused for identical input
+POEM_CACHE_MAX_ENTRIES = 256  # oldest poems are evicted beyond this
 
-def check_password():
-    """Returns `True` if the user had the correct password."""
-    
-    # Get password from env or secrets
-    correct_password = os.getenv("APP_PASSWORD")
-    # Fallback to secrets if not in env
-    if not correct_password:
-        try:
-            if "APP_PASSWORD" in st.secrets:
-                correct_password = st.secrets["APP_PASSWORD"]
-        except:
-            pass
+# Output budget per poem. STYLE_GUIDE caps poems at twenty lines, which fits
+# with room to spare even for long comic lines.
+MAX_POEM_TOKENS = 400
 
-    # If no password set, default to open (or handle as error)
-    # For safety, let's require it if this function is called
-    if not correct_password:
-        st.warning("App is password protected but APP_PASSWORD is not set.")
-        return False
+# Streamed text is redrawn once this many new characters arrive or this many
+# seconds pass, whichever comes first (~20 Hz instead of once per token)
+FLUSH_MIN_CHARS = 8
+FLUSH_INTERVAL = 0.05
 
-    def password_entered():
-        """Checks whether a password entered by the user is correct."""
-        if st.session_state["password"] == correct_password:
-            st.session_state["password_correct"] = True
-            del st.session_state["password"]  # don't store password
-        else:
-            st.session_state["password_correct"] = False
+POETS = (
+    "Emily Dickinson",
+    "T.S. Eliot",
+    "Langston Hughes",
+    "Sylvia Plath",
+    "Seamus Heaney",
+    "Shel Silverstein",
+    "Lewis Carroll",
+    "Robert Frost",
+    "Ogden Nash",
+    "Pablo Neruda",
+    "Dr. Seuss",
+)
 
-    if "password_correct" not in st.session_state:
-        # First run, show input
-        st.text_input(
-            "Enter Password", type="password", on_change=password_entered, key="password"
-        )
-        return False
-    elif not st.session_state["password_correct"]:
-        # Password incorrect, show input + error
-        st.text_input(
-            "Enter Password", type="password", on_change=password_entered, key="password"
-        )
-        st.error("😕 Password incorrect")
-        return False
-    else:
-        # Password correct
-        return True
+# Default poet template. A POEM_SYSTEM_PROMPT override replaces only this part;
+# PROMPT_PREFIX below is always sent in front of it.
+DEFAULT_SYSTEM_PROMPT = "You are {poet}. Write a short poem based on the user's description of their day."
 
-def main():
-    st.set_page_config(
-        page_title="Daily Reflection", 
-        page_icon="📜",
-        layout="centered"
-    )
-    
-    # Check password before showing the app
-    if not check_password():
-        st.stop()
+# Static prefix shared by every request. It is deliberately long (>1024 tokens)
+# and comes before anything poet- or user-specific so OpenAI's automatic prompt
+# caching can reuse it across requests.
+STYLE_GUIDE = """\
+You write short poems for a quiet evening reflection app called The Still Point.
+A reader has just described their day in a few sentences. Your job is to hand
+that day back to them as a poem: something they can read slowly, in under a
+minute, and recognise as their own.
+
+General craft guidelines:
+- Length: roughly eight to sixteen lines. Never more than twenty lines.
+- Stay close to the concrete details the reader gave you. A named object, a
+  place, a time of day, or a person from their description should appear in the
+  poem. Do not invent dramatic events that did not happen.
+- Prefer images to explanations. Show the tired hands, the cold coffee, the
+  train window, rather than saying "it was a long day".
+- Let the poem turn somewhere. A good short poem usually shifts once: from the
+  outside world to the inside, from the day to the night, from complaint to
+  acceptance, from noise to stillness.
+- End gently. The final line should leave the reader a little calmer than the
+  first line found them. Avoid moralising, advice, or therapy language.
+- Keep the emotional register honest. If the day was hard, do not pretend it
+  was wonderful; find the small true thing worth keeping instead.
+- Match the reader's language. If they write casually, you may be playful; if
+  they write with grief or worry, be tender and restrained.
+- Never mention that you are an AI, a model, or a persona. Never address the
+  reader as "user".
+
+Formatting rules:
+- Output only the poem. No title unless the poet's style strongly calls for one.
+- No preface such as "Here is a poem", and no closing commentary.
+- Use plain line breaks between lines and a blank line between stanzas.
+- Do not use Markdown headings, bullet points, bold text, or code blocks.
+- Do not sign the poem; the app adds the attribution itself.
+- Do not wrap the poem in quotation marks.
+
+Small moves that tend to work:
+- Open inside a moment rather than with a summary: the kettle clicking off,
+  the last email sent, the bus pulling away.
+- Give one line to something the reader did not mention but would have seen:
+  the light at that hour, the sound of the street, the weight of a bag.
+- Let an ordinary object carry the feeling of the day, and return to it near
+  the end so the poem closes like a circle.
+- Use the reader's own words once, lightly, so they hear themselves in it.
+- Leave a little white space. A short final stanza of one or two lines often
+  gives the reader room to breathe.
+
+Safety and tone:
+- If the description mentions self-harm, abuse, or a crisis, still write with
+  care, keep the poem gentle, and do not romanticise harm.
+- Do not include real people's private information beyond what the reader wrote.
+- Keep the poem suitable for a general audience.
+
+"""
+
+POET_NOTES = """\
+Voice notes for each poet you may be asked to write as. Capture the manner,
+rhythm, and preoccupations described here; never quote or closely paraphrase
+the poet's actual published lines.
+
+Emily Dickinson: compressed quatrains, often in common meter. Slant rhyme.
+Dashes that interrupt and suspend thought. Capitalised Nouns for emphasis.
+Small domestic scenes opening onto death, eternity, or the soul. Riddling,
+sidelong, wry.
+
+T.S. Eliot: free verse that drifts into and out of meter. Urban twilight,
+fog, stairs, rooms, crowds. Fragments, allusion, and sudden shifts of speaker.
+A weary, ironic modern self measuring out ordinary hours, with a late turn
+toward stillness or grace.
+
+Langston Hughes: musical, plain-spoken lines shaped by blues and jazz. Repetition
+and refrain. Everyday working life, city streets, dreams deferred and dreams
+kept. Dignity, warmth, and quiet resistance; short lines that land hard.
 
-    # Kindle/E-ink aesthetic CSS
-    st.markdown("""
+Sylvia Plath: vivid, intense imagery with sharp sound. Colour, the body,
+weather, domestic objects made strange. Controlled stanzas carrying volatile
+feeling. Metaphors that transform quickly. In this app, keep the intensity
+but steer the ending toward survival and light.
+
+Seamus Heaney: rooted, physical language. Soil, tools, water, hands at work,
+kitchens, family rituals. Dense consonant sounds and careful rhythm. Memory
+rising out of ordinary labour; the ground under the day.
+
+Shel Silverstein: playful rhyming verse for all ages. Simple words, bouncy
+meter, absurd premises taken seriously, and a gentle twist at the end that
+reveals a kindness or truth.
+
+Lewis Carroll: nonsense verse with strict meter and rhyme. Invented words
+that sound right, logical absurdity, mock-serious tone, and a whimsical
+narrative that still sneaks in the reader's real day.
+
+Robert Frost: conversational blank verse or regular rhymed stanzas. Rural
+settings, woods, walls, weather, roads, and chores. Plain speech with a dark
+undertow; a simple scene that quietly opens into a choice or reflection.
+
+Ogden Nash: comic light verse with outrageous, stretched, or invented rhymes.
+Lines of wildly uneven length. Wry observations about daily annoyances,
+animals, food, and human folly, delivered with affection.
+
+Pablo Neruda: sensual, expansive free verse. Odes to ordinary things such as
+bread, socks, onions, the sea. Long lines full of metaphor, tenderness, and
+wonder at the material world; love and longing in plain objects.
+
+Dr. Seuss: bouncy anapestic tetrameter with tight rhymes. Invented creatures
+and words, repetition, and a clear, hopeful message by the end. Simple enough
+to read aloud to a child, heartfelt enough for an adult.
+
+"""
+
+PROMPT_PREFIX = STYLE_GUIDE + POET_NOTES
+
+# Kindle/E-ink aesthetic CSS
+_CSS = """
     <style>
     @import url('https://fonts.googleapis.com/css2?family=Merriweather:ital,wght@0,300;0,400;0,700;1,300&display=swap');
 
@@ -245,7 +282,291 @@ def main():
     footer {visibility: hidden;}
     header {visibility: hidden;}
     </style>
-    """, unsafe_allow_html=True)
+"""
+
+# Note: utils/redshift_connection.py was not found in the workspace, 
+# so the Redshift integration has been omitted. 
+# To add it, create the file and import it here.
+
+class PoemTruncated(Exception):
+    """Raised when a poem stream stops at the token limit instead of finishing."""
+
+@dataclass(frozen=True)
+class Config:
+    api_key: Optional[str]
+    system_prompts: Mapping[str, str]  # poet -> full system message
+    password: Optional[str]
+
+def _get_setting(name):
+    """Reads a setting from the environment, falling back to Streamlit secrets."""
+    value = os.getenv(name)
+    if not value:
+        try:
+            if name in st.secrets:
+                value = st.secrets[name]
+        except Exception:
+            pass
+    # TOML secrets may be numbers (e.g. APP_PASSWORD = 1234); settings are strings
+    return str(value) if value is not None else None
+
+def _build_system_prompts(template):
+    """Formats the poet template for every poet, falling back to the default."""
+    try:
+        poet_prompts = {poet: template.format(poet=poet) for poet in POETS}
+    except (KeyError, IndexError, ValueError, AttributeError) as e:
+        # A bad override (e.g. literal braces) must not take the whole app down
+        logger.warning("Invalid POEM_SYSTEM_PROMPT (%r); using the default prompt.", e)
+        poet_prompts = {poet: DEFAULT_SYSTEM_PROMPT.format(poet=poet) for poet in POETS}
+    # Poet-specific text goes last so the shared prefix stays cacheable
+    return MappingProxyType({poet: PROMPT_PREFIX + p for poet, p in poet_prompts.items()})
+
+@st.cache_resource(show_spinner=False)
+def get_config() -> Config:
+    """Resolves app settings once per process instead of on every rerun.
+
+    Cached as a resource so every call returns the same read-only object
+    rather than an unpickled copy.
+    """
+    # Load environment variables
+    load_dotenv()
+    return Config(
+        api_key=_get_setting("OPENAI_API_KEY"),
+        system_prompts=_build_system_prompts(_get_setting("POEM_SYSTEM_PROMPT") or DEFAULT_SYSTEM_PROMPT),
+        password=_get_setting("APP_PASSWORD"),
+    )
+
+@st.cache_resource
+def get_openai_client(api_key: str) -> Tuple[asyncio.AbstractEventLoop, AsyncOpenAI]:
+    """Returns a shared OpenAI client and the background event loop it runs on.
+
+    They are cached as one resource because the client's connection pool only
+    works on the loop it first ran on.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="openai-io", daemon=True).start()
+    return loop, AsyncOpenAI(api_key=api_key)
+
+@st.cache_resource
+def _poem_cache():
+    """Process-wide store of finished poems: day description -> (timestamp, poem, poet).
+
+    Entries are kept in insertion order, so the oldest is always first.
+    """
+    return OrderedDict()
+
+@st.cache_resource
+def _poem_cache_lock():
+    """Guards writes to the poem cache, which every session thread shares."""
+    # Held as a cached resource: a module-level lock would be rebuilt on every rerun
+    return threading.Lock()
+
+def _log_prompt_cache(usage):
+    """Logs how much of the prompt OpenAI served from its prompt cache."""
+    details = usage.prompt_tokens_details
+    cached = details.cached_tokens if details else 0
+    logger.info("Prompt tokens: %s (cached: %s)", usage.prompt_tokens, cached)
+
+async def stream_poem(client, day_description, system_content):
+    """Yields the text deltas of a streamed poem completion."""
+    # Using gpt-5.1 as requested
+    stream = await client.chat.completions.create(
+        model="gpt-5.1",  ## please use gpt-5.1 for the best results. it is a real model available now.
+        messages=[
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": day_description}
+        ],
+        # gpt-5.1 takes max_completion_tokens rather than max_tokens; with no
+        # reasoning the whole budget goes to the poem
+        max_completion_tokens=MAX_POEM_TOKENS,
+        reasoning_effort="none",
+        temperature=0.8,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    finish_reason = None
+    # Closing the stream drops the HTTP response, so a cancelled poem stops generating
+    async with stream:
+        async for chunk in stream:
+            if chunk.usage:
+                _log_prompt_cache(chunk.usage)
+            if chunk.choices:
+                if chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+    if finish_reason == "length":
+        # Raising keeps the cut-off poem out of the cache and off the "finished" path
+        raise PoemTruncated("the poem ran past the length limit and was cut off.")
+
+async def _pump_tokens(tokens, out):
+    """Drains an async token stream into a queue read by the script thread."""
+    try:
+        async for token in tokens:
+            out.put(token)
+    except Exception as e:
+        out.put(e)
+    finally:
+        # Always end the queue, even on cancellation, so the reader never hangs
+        out.put(_STREAM_END)
+
+def _iter_queue(out, future):
+    """Yields queued tokens, cancelling the producer if the reader stops early."""
+    try:
+        while True:
+            item = out.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # No-op once the stream has finished; otherwise stops an abandoned
+        # completion (rerun, stop, error) from being read to the end
+        future.cancel()
+
+def _generate_poem_uncached(day_description, system_content, api_key):
+    """Starts a streamed completion and returns a generator of text deltas.
+
+    Returns None if the model finished without producing any text.
+    """
+    loop, client = get_openai_client(api_key)
+    out = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        _pump_tokens(stream_poem(client, day_description, system_content), out), loop
+    )
+    tokens = _iter_queue(out, future)
+    # Wait for the first token here so request errors surface to the caller
+    first = next(tokens, None)
+    if first is None:
+        return None
+
+    def stream_tokens():
+        yield first
+        yield from tokens
+
+    return stream_tokens()
+
+def get_poem_cached(day_description):
+    """Returns (poem, poet, cache_hit) for the day.
+
+    On a cache hit `poem` is the finished text from the last hour; otherwise it
+    is a generator of streamed tokens.
+    """
+    cache = _poem_cache()
+    entry = cache.get(day_description)
+    if entry and time.monotonic() - entry[0] < POEM_CACHE_TTL:
+        _, poem, poet = entry
+        return poem, poet, True
+
+    cfg = get_config()
+    if not cfg.api_key:
+        st.error("OpenAI API Key not found. Please set it in a .env file or Streamlit secrets.")
+        return None, None, False
+    
+    # Seed from the text so the same day always gets the same poet (and cache entry)
+    selected_poet = random.Random(day_description).choice(POETS)
+    
+    try:
+        tokens = _generate_poem_uncached(day_description, cfg.system_prompts[selected_poet], cfg.api_key)
+    except Exception as e:
+        st.error(f"Error generating poem: {e}")
+        return None, None, False
+    if tokens is None:
+        st.error("Error generating poem: the model returned an empty response.")
+        return None, None, False
+
+    def remember_poem():
+        # Only a fully streamed poem is stored, so failed generations are retried
+        parts = []
+        try:
+            for token in tokens:
+                parts.append(token)
+                yield token
+        finally:
+            tokens.close()
+        now = time.monotonic()
+        with _poem_cache_lock():
+            cache.pop(day_description, None)
+            cache[day_description] = (now, "".join(parts), selected_poet)
+            # Drop expired entries from the old end, then cap the size
+            while cache and now - next(iter(cache.values()))[0] >= POEM_CACHE_TTL:
+                cache.popitem(last=False)
+            while len(cache) > POEM_CACHE_MAX_ENTRIES:
+                cache.popitem(last=False)
+
+    return remember_poem(), selected_poet, False
+
+def check_password():
+    """Draws the password prompt for a session that has not unlocked the app yet."""
+    
+    correct_password = get_config().password
+
+    # If no password set, default to open (or handle as error)
+    # For safety, let's require it if this function is called
+    if not correct_password:
+        st.warning("App is password protected but APP_PASSWORD is not set.")
+        return
+
+    def password_entered():
+        """Checks whether a password entered by the user is correct."""
+        entered = st.session_state["password"].encode()
+        if hmac.compare_digest(entered, correct_password.encode()):
+            st.session_state["password_correct"] = True
+            del st.session_state["password"]  # don't store password
+        else:
+            st.session_state["password_correct"] = False
+
+    st.text_input(
+        "Enter Password", type="password", on_change=password_entered, key="password"
+    )
+    if st.session_state.get("password_correct") is False:
+        # A previous attempt was wrong
+        st.error("😕 Password incorrect")
+
+def run_typewriter(tokens, poem_placeholder):
+    """Renders streamed tokens into the placeholder and returns the poem HTML."""
+    # Typewriter effect, paced by the model's own token stream
+    # Tokens are converted to HTML once each and joined only on redraw
+    html_parts = []
+    pending_chars = 0
+    last_flush = time.monotonic()
+    try:
+        for token in tokens:
+            html_parts.append(token.replace('\n', '<br>'))
+            pending_chars += len(token)
+            # Coalesce redraws: each markdown call is a websocket round-trip
+            now = time.monotonic()
+            if pending_chars < FLUSH_MIN_CHARS and now - last_flush < FLUSH_INTERVAL:
+                continue
+            pending_chars = 0
+            last_flush = now
+            
+            poem_placeholder.markdown(f"""
+            <div class="poem-container">
+                <div class="poem-text">{''.join(html_parts)}</div>
+            </div>
+            """, unsafe_allow_html=True)
+    finally:
+        # A rerun or stop raises out of markdown(); close the stream right away
+        # so the completion is cancelled instead of read to the end
+        tokens.close()
+    return "".join(html_parts)
+
+def main():
+    st.set_page_config(
+        page_title="Daily Reflection", 
+        page_icon="📜",
+        layout="centered"
+    )
+    
+    # Check password before showing the app; once unlocked, later reruns skip
+    # the check entirely
+    if not st.session_state.get("password_correct"):
+        check_password()
+        st.stop()
+
+    # Streamlit drops elements a rerun doesn't emit, so the style block is
+    # re-sent every run; it is built once at import rather than per rerun
+    st.markdown(_CSS, unsafe_allow_html=True)
 
     st.title("How was your day today?")
     
@@ -261,27 +582,22 @@ def main():
     if submitted:
         if day_input.strip():
             with st.spinner("Writing..."):
-                poem, poet = get_poem(day_input)
+                poem, poet, cache_hit = get_poem_cached(day_input)
                 
             if poem and poet:
                 poem_placeholder = st.empty()
                 
-                # Typewriter effect
-                full_text = ""
-                for char in poem:
-                    full_text += char
-                    # Update display with current text (converting newlines to breaks)
-                    current_html = full_text.replace('\n', '<br>')
-                    
-                    poem_placeholder.markdown(f"""
-                    <div class="poem-container">
-                        <div class="poem-text">{current_html}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    time.sleep(0.03) # Adjust speed here (0.03s per char)
+                if cache_hit:
+                    # Already written: show it in one render, no typewriter
+                    final_html = poem.replace('\n', '<br>')
+                else:
+                    try:
+                        final_html = run_typewriter(poem, poem_placeholder)
+                    except Exception as e:
+                        st.error(f"Error generating poem: {e}")
+                        return
                 
                 # Final render with attribution
-                final_html = poem.replace('\n', '<br>')
                 poem_placeholder.markdown(f"""
                 <div class="poem-container">
                     <div class="poem-text">{final_html}</div>